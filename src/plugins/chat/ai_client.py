@@ -2,14 +2,26 @@ import httpx
 import time
 import asyncio
 import os
+import random
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional, Union, Tuple
+from nonebot import get_driver
 from nonebot.log import logger
 from .lifecycle import ResourceManager
-from .config import config, Config
+from .config import Config
+
+# 同时在途的上游请求上限
+MAX_CONCURRENCY = 8
+# 记录固定模型的会话数上限，超出后淘汰最久未使用的会话
+MAX_STICKY_SESSIONS = 4096
+# 可重试的HTTP状态码（如429太多请求、503服务不可用）
+RETRY_CODES = frozenset({429, 500, 502, 503, 504})
 
 class AIRequestError(Exception):
     """AI请求异常"""
     
+    __slots__ = ("message", "status_code", "original_error", "response_data")
+    
     def __init__(self, message: str, status_code: Optional[int] = None, 
                  original_error: Optional[Exception] = None, 
                  response_data: Optional[Dict[str, Any]] = None):
@@ -32,17 +44,40 @@ class AIClient:
     def __init__(self):
         self.timeout = 30.0
         self.max_retries = 2
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        # 每个会话固定使用同一模型，使提示词前缀能命中服务端缓存（按LRU限制条目数）
+        self._sticky_models = OrderedDict()
+        self._cfg: Optional[Config] = None
+    
+    async def close(self):
+        """关闭连接池"""
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+    
+    def _remember_model(self, session_key: Any, model: str):
+        """记录会话使用的模型，并淘汰最久未使用的记录"""
+        self._sticky_models[session_key] = model
+        self._sticky_models.move_to_end(session_key)
+        if len(self._sticky_models) > MAX_STICKY_SESSIONS:
+            self._sticky_models.popitem(last=False)
+    
+    async def _get_config(self) -> Optional[Config]:
+        """获取配置，首次获取后缓存在实例上"""
+        if self._cfg is None:
+            self._cfg = await ResourceManager.get('config')
+        return self._cfg
     
     async def _get_api_info(self) -> tuple:
         """异步获取API信息"""
-        config = await ResourceManager.get('config')
+        config = await self._get_config()
         if not config:
             raise AIRequestError("无法获取配置")
         return config.get_current_api_info()
     
-    async def _make_request(self, endpoint: str, payload: Dict[str, Any], 
-                           retry_count: int = 0) -> Dict[str, Any]:
-        """发送请求到AI服务"""
+    async def _make_request(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """发送请求到AI服务，失败时按指数退避重试"""
         api_base, api_key = await self._get_api_info()
         if not api_base or not api_key:
             raise AIRequestError("API配置不完整")
@@ -50,50 +85,62 @@ class AIClient:
         headers = {"Authorization": f"Bearer {api_key}"}
         url = f"{api_base}/{endpoint.lstrip('/')}"
         
-        try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(url, json=payload, headers=headers)
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._client.post(url, json=payload, headers=headers)
                 response.raise_for_status()
                 return response.json()
-        except httpx.HTTPStatusError as e:
-            # 处理HTTP错误
-            error_msg = f"API请求失败"
-            status_code = e.response.status_code
-            response_data = None
-            
-            try:
-                response_data = e.response.json()
-                if "error" in response_data:
-                    error_msg = f"API错误: {response_data['error'].get('message', str(response_data))}"
-            except:
-                pass
-                
-            # 对于某些状态码尝试重试（如429太多请求、503服务不可用）
-            if status_code in (429, 500, 502, 503, 504) and retry_count < self.max_retries:
-                return await self._make_request(endpoint, payload, retry_count + 1)
+            except httpx.HTTPStatusError as e:
+                # 处理HTTP错误
+                error_msg = f"API请求失败"
+                status_code = e.response.status_code
+                response_data = None
                 
-            raise AIRequestError(error_msg, status_code=status_code, 
-                               original_error=e, response_data=response_data)
-                               
-        except httpx.RequestError as e:
-            # 处理请求异常（如超时、连接问题）
-            if retry_count < self.max_retries:
-                return await self._make_request(endpoint, payload, retry_count + 1)
+                try:
+                    response_data = e.response.json()
+                    if "error" in response_data:
+                        error_msg = f"API错误: {response_data['error'].get('message', str(response_data))}"
+                except:
+                    pass
+                    
+                if status_code in RETRY_CODES and attempt < self.max_retries:
+                    await asyncio.sleep(self._backoff_delay(attempt))
+                    continue
+                    
+                raise AIRequestError(error_msg, status_code=status_code, 
+                                   original_error=e, response_data=response_data)
+                                   
+            except httpx.RequestError as e:
+                # 处理请求异常（如超时、连接问题）
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self._backoff_delay(attempt))
+                    continue
+                    
+                raise AIRequestError(f"请求异常: {str(e)}", original_error=e)
                 
-            raise AIRequestError(f"请求异常: {str(e)}", original_error=e)
-            
-        except Exception as e:
-            # 处理其他异常
-            raise AIRequestError(f"未知错误: {str(e)}", original_error=e)
+            except Exception as e:
+                # 处理其他异常
+                raise AIRequestError(f"未知错误: {str(e)}", original_error=e)
+    
+    @staticmethod
+    def _backoff_delay(attempt: int) -> float:
+        """重试等待时间：50ms、200ms、800ms...，附加少量随机抖动"""
+        return 0.05 * 4 ** attempt + random.random() * 0.05
     
     async def get_chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> str:
-        """获取聊天回复"""
-        config = await ResourceManager.get('config')
+        """获取聊天回复，同时在途的请求数受并发上限约束"""
+        async with self._semaphore:
+            return await self._chat_completion(messages, **kwargs)
+    
+    async def _chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """直接请求聊天回复"""
+        config = await self._get_config()
         if not config:
             return "配置未就绪，请稍后再试"
             
+        session_key = kwargs.get('session_key')
         if 'model' not in kwargs or kwargs['model'] is None:
-            kwargs['model'] = config.get_random_model()
+            kwargs['model'] = self._sticky_models.get(session_key) or config.get_random_model()
             
         payload = {
             "model": kwargs['model'],
@@ -106,8 +153,15 @@ class AIClient:
             
         try:
             response = await self._make_request("chat/completions", payload)
-            return response["choices"][0]["message"]["content"]
+            content = response["choices"][0]["message"]["content"]
+            if session_key is not None:
+                self._remember_model(session_key, kwargs['model'])
+            return content
         except AIRequestError as e:
+            # 出错后下次重新抽取模型
+            if session_key is not None:
+                self._sticky_models.pop(session_key, None)
+            
             # 如果是模型相关错误且允许重试不同模型
             if kwargs.get('retry_different_model', True) and e.status_code in (400, 404) and kwargs['model']:
                 # 尝试使用不同模型
@@ -117,9 +171,10 @@ class AIClient:
                         None
                     )
                     if new_model:
-                        return await self.get_chat_completion(
+                        return await self._chat_completion(
                             messages, model=new_model, temperature=kwargs.get('temperature', 0.7),
-                            max_tokens=kwargs.get('max_tokens'), retry_different_model=False
+                            max_tokens=kwargs.get('max_tokens'), retry_different_model=False,
+                            session_key=session_key
                         )
                 except Exception:
                     pass  # 如果重试失败，返回原始错误
@@ -128,10 +183,39 @@ class AIClient:
         except Exception as e:
             return f"处理AI回复时出错: {str(e)}"
 
+    
+    async def summarize(self, messages: List[Dict[str, str]], instruction: str,
+                        max_tokens: int = 200) -> str:
+        """按指令概括一段对话，失败时抛出AIRequestError"""
+        config = await self._get_config()
+        if not config:
+            raise AIRequestError("无法获取配置")
+        
+        payload = {
+            "model": config.get_random_model(),
+            "messages": [{"role": "system", "content": instruction}, *messages],
+            "temperature": 0.3,
+            "max_tokens": max_tokens
+        }
+        # 与聊天请求共用并发上限
+        async with self._semaphore:
+            response = await self._make_request("chat/completions", payload)
+        try:
+            return response["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise AIRequestError("回复格式异常", original_error=e, response_data=response)
+
 
 # 初始化AI客户端
 async def initialize_ai_client():
     client = AIClient()
+    # 复用同一个连接池（keep-alive + HTTP/2），避免每次请求重新握手
+    client._client = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(client.timeout, connect=5.0),
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+    )
+    get_driver().on_shutdown(client.close)
     ResourceManager.set('ai_client', client)
 
 # 注册AI客户端，依赖于配置
@@ -1,11 +1,11 @@
 import asyncio
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence
 import random
 from nonebot.log import logger
 from nonebot.adapters.onebot.v11 import GroupMessageEvent, Message, MessageSegment
 from .lifecycle import ResourceManager
 from .ai_client import get_ai_client
-from .message_handler import MessageProcessor
+from .message_handler import IncomingCtx, MessageProcessor
 
 
 class ChatBot:
@@ -15,12 +15,16 @@ class ChatBot:
         self.context_manager = None
         self.config = None
         self.group_manager = None
+        self._bot_qq = 0
+        self._rand_threshold = 0.1  # 备用逻辑的随机回复率
 
     async def initialize(self):
         """初始化机器人"""
         self.context_manager = await ResourceManager.get("context_manager")
         self.config = await ResourceManager.get("config")
         self.group_manager = await ResourceManager.get("group_manager")
+        if self.config:
+            self._bot_qq = self.config.bot.qq_int
 
     async def get_group_config(self, group_id: int):
         """获取群组配置"""
@@ -29,31 +33,43 @@ class ChatBot:
         return None
 
     async def process_message(
-        self, text: str, group_id: int, user_id: int, group_config=None
+        self,
+        incoming: IncomingCtx,
+        group_id: int,
+        user_id: int,
+        group_config=None,
+        context: Optional[Sequence[Dict[str, str]]] = None,
     ) -> Optional[str]:
         """处理消息，获取AI回复"""
         if not self.config:
             logger.error("配置未就绪")
             return None
 
+        text = incoming.text
+
         # 检查用户是否被屏蔽 (仍保留作为安全措施)
         if self.group_manager and self.group_manager.is_user_blocked(user_id, group_id):
             logger.debug(f"用户 {user_id} 在群 {group_id} 中被屏蔽")
             return None
 
         # 检查消息长度
-        if not self.config.check_message_length(text):
+        if not incoming.length_ok:
             return None
 
-        # 获取对话上下文
-        context = []
-        if self.context_manager:
-            context = await self.context_manager.get_context(
-                group_id=group_id, user_id=user_id
-            )
-
-        # 构建消息
-        messages = context + [{"role": "user", "content": text}]
+        # 获取对话上下文（调用方已获取时直接复用）
+        if context is None:
+            context = []
+            if self.context_manager:
+                context = await self.context_manager.get_context(
+                    group_id=group_id, user_id=user_id
+                )
+
+        # 构建消息：固定的系统提示放在最前，便于命中服务端前缀缓存
+        messages = []
+        if self.config.bot.system_prompt:
+            messages.append({"role": "system", "content": self.config.bot.system_prompt})
+        messages.extend(context)
+        messages.append({"role": "user", "content": text})
 
         # 获取AI客户端
         client = await get_ai_client()
@@ -62,7 +78,9 @@ class ChatBot:
             return None
 
         # 调用AI获取回复
-        response = await client.get_chat_completion(messages=messages)
+        response = await client.get_chat_completion(
+            messages=messages, session_key=(group_id, user_id)
+        )
 
         # 保存新的上下文
         if self.context_manager and response:
@@ -84,30 +102,28 @@ class ChatBot:
         return response
 
     def should_respond_to_message(
-        self, text: str, is_at: bool = False, group_id: int = None, user_id: int = None
+        self, incoming: IncomingCtx, group_id: int = None, user_id: int = None
     ) -> bool:
         """决定是否应该回复消息"""
-        if not self.config:
-            return False
-
-        # 检查消息长度
-        if not self.config.check_message_length(text):
+        # 大部分消息在这里被拒绝，最便宜的检查放在最前
+        # (调用方在配置就绪后才会计算 length_ok)
+        if not incoming.length_ok:
             return False
 
         # 使用MessageProcessor中的should_reply函数，这是为了模拟人类行为
         if group_id is not None and user_id is not None:
-            return MessageProcessor.should_reply(text, is_at, group_id, user_id)
+            return MessageProcessor.should_reply(
+                incoming.text, incoming.is_at, group_id, user_id
+            )
 
         # 基本的回复逻辑（备用）
-        if is_at:
-            return True
-        return random.random() < 0.1
+        return incoming.is_at or random.random() < self._rand_threshold
 
     def format_response(
         self,
         text: str,
         user_id: int,
-        event: GroupMessageEvent = None,
+        is_at_bot: bool = False,
         context_length: int = 0,
     ) -> Message:
         """
@@ -117,7 +133,7 @@ class ChatBot:
         Args:
             text: 回复文本
             user_id: 用户ID
-            event: 消息事件
+            is_at_bot: 消息是否@了机器人
             context_length: 当前上下文消息数
         """
         msg = Message()
@@ -130,10 +146,7 @@ class ChatBot:
             should_at = True
 
         # 条件2: @了机器人，但上下文超过3条时才使用@回复
-        if event and any(
-            seg.type == "at" and str(seg.data.get("qq", "")) == str(self.config.bot.qq)
-            for seg in event.message
-        ):
+        if is_at_bot:
             should_at = context_length > 3
 
         # 根据决策添加@或直接回复
@@ -148,6 +161,9 @@ class ChatBot:
 # 初始化机器人实例
 _bot_instance = None
 
+# 后台发送任务的引用，防止任务未完成就被垃圾回收
+_background_tasks = set()
+
 
 async def initialize_bot():
     """初始化聊天机器人"""
@@ -180,34 +196,41 @@ async def handle_group_message(event: GroupMessageEvent):
         logger.error("机器人实例未就绪")
         return
 
+    # 配置加载失败或超时时静默忽略消息
+    if not bot.config:
+        return
+
     try:
-        # 获取文本和@状态
-        text = MessageProcessor.extract_text(event)
-        is_at = MessageProcessor.is_at_bot(event, bot.config.bot.qq)
+        # 一次性提取文本、@状态和长度检查结果
+        _, text, is_at = MessageProcessor.parse_message(event, bot._bot_qq)
+        incoming = IncomingCtx(
+            text=text,
+            is_at=is_at,
+            length_ok=bot.config.check_message_length(text),
+        )
 
         # 检查响应条件
-        if not bot.should_respond_to_message(
-            text, is_at, event.group_id, event.user_id
-        ):
+        if not bot.should_respond_to_message(incoming, event.group_id, event.user_id):
             return
 
-        # 获取群组配置（如果存在）
+        # 获取群组配置
         group_config = await bot.get_group_config(event.group_id)
 
-        # 获取当前上下文消息数
-        context_length = 0
+        # 获取当前上下文，之后直接传给process_message复用
+        context = []
         if bot.context_manager:
             context = await bot.context_manager.get_context(
                 group_id=event.group_id, user_id=event.user_id
             )
-            context_length = len(context)
+        context_length = len(context)
 
         # 处理消息获取回复
         response_text = await bot.process_message(
-            text=text,
+            incoming=incoming,
             group_id=event.group_id,
             user_id=event.user_id,
             group_config=group_config,
+            context=context,
         )
 
         # 如果有回复，模拟人类打字时间后发送
@@ -216,17 +239,27 @@ async def handle_group_message(event: GroupMessageEvent):
             typing_delay = MessageProcessor.calculate_typing_delay(response_text)
             await asyncio.sleep(typing_delay)
 
-            # 发送回复（传入原始事件和上下文长度）
+            # 发送回复（传入@状态和上下文长度）
             response_msg = bot.format_response(
-                response_text, event.user_id, event, context_length
+                response_text, event.user_id, incoming.is_at, context_length
             )
             await event.reply(response_msg)
 
-            # 偶尔模拟发送后纠正错别字
+            # 偶尔模拟发送后纠正错别字（后台发送，不占用当前处理流程）
             if MessageProcessor.should_correct_typo():
-                await asyncio.sleep(random.uniform(1.0, 3.0))
-                correction_msg = MessageProcessor.make_correction(response_msg)
-                await event.reply(correction_msg)
+                task = asyncio.create_task(_send_correction(event, response_msg))
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
 
     except Exception as e:
         logger.exception(f"处理群组消息出错: {str(e)}")
+
+
+async def _send_correction(event: GroupMessageEvent, response_msg: Message):
+    """稍等片刻后发送“纠正错别字”的消息"""
+    try:
+        await asyncio.sleep(random.uniform(1.0, 3.0))
+        correction_msg = MessageProcessor.make_correction(response_msg)
+        await event.reply(correction_msg)
+    except Exception as e:
+        logger.exception(f"发送纠错消息出错: {str(e)}")
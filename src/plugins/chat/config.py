@@ -1,10 +1,16 @@
 import os
+import asyncio
+import random
+import itertools
 import tomli
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from pathlib import Path
 from pydantic import BaseModel
 from .lifecycle import ResourceManager
 
+# TOML解析结果缓存：路径 -> (文件修改时间, 配置内容)
+_toml_cache: Dict[str, Tuple[int, dict]] = {}
+
 
 class APIConfig(BaseModel):
     """API相关配置"""
@@ -20,6 +26,12 @@ class BotConfig(BaseModel):
 
     name: str = "MyChatBot"
     qq: str = ""
+    system_prompt: str = ""
+
+    @property
+    def qq_int(self) -> int:
+        """qq的整数形式，便于直接比较（始终由qq推导，非数字时为0）"""
+        return int(self.qq) if self.qq.isdigit() else 0
 
 
 class MessageConfig(BaseModel):
@@ -63,17 +75,27 @@ class ConfigLoader:
             ).parent.parent.parent
             file_path = project_root / "config.toml"
 
-        if not os.path.exists(file_path):
+        try:
+            mtime = os.stat(file_path).st_mtime_ns
+        except FileNotFoundError:
             return {}
 
+        # 文件未修改时直接使用缓存
+        key = str(file_path)
+        cached = _toml_cache.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
         with open(file_path, "rb") as f:
-            return tomli.load(f)
+            data = tomli.load(f)
+        _toml_cache[key] = (mtime, data)
+        return data
 
     @classmethod
     def load_config(cls) -> dict:
         """加载所有配置"""
-        # 先加载配置文件
-        config = cls.load_toml_config()
+        # 先加载配置文件（复制一份，避免修改缓存内容）
+        config = dict(cls.load_toml_config())
         # 再加载环境变量(会覆盖配置文件中的同名配置)
         env_config = cls.load_env_config()
 
@@ -81,7 +103,7 @@ class ConfigLoader:
         for key, value in env_config.items():
             if key in config:
                 if isinstance(value, dict) and isinstance(config[key], dict):
-                    config[key].update(value)
+                    config[key] = {**config[key], **value}
                 else:
                     config[key] = value
             else:
@@ -96,17 +118,18 @@ class Config:
     _instance = None
     _initialized = False
 
-    def __new__(cls):
+    def __new__(cls, config_data: dict = None):
         if cls._instance is None:
             cls._instance = super(Config, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self):
+    def __init__(self, config_data: dict = None):
         if self._initialized:
             return
 
-        # 加载配置
-        config_data = ConfigLoader.load_config()
+        # 未传入已加载的配置时同步加载
+        if config_data is None:
+            config_data = ConfigLoader.load_config()
 
         # 解析各模块配置
         self.api = APIConfig(**config_data.get("api", {}))
@@ -114,14 +137,29 @@ class Config:
         self.message = MessageConfig(**config_data.get("message", {}))
         self.response = ResponseConfig(**config_data.get("response", {}))
 
+        # 消息长度限制直接挂在实例上，减少每条消息的属性查找
+        self.min_text_length = self.message.min_text_length
+        self.max_text_length = self.message.max_text_length
+
+        # 预先计算API信息和模型抽样表，避免每次请求重复计算
+        self._api_info = self._resolve_api_info()
+        self._models = tuple(self.response.model_probabilities.keys())
+        self._cum_weights = list(
+            itertools.accumulate(self.response.model_probabilities.values())
+        )
+
         self._initialized = True
 
     def check_message_length(self, text: str) -> bool:
         """检查消息长度是否符合要求"""
-        return self.message.min_text_length <= len(text) <= self.message.max_text_length
+        return self.min_text_length <= len(text) <= self.max_text_length
 
     def get_current_api_info(self) -> tuple:
         """获取当前使用的API信息"""
+        return self._api_info
+
+    def _resolve_api_info(self) -> tuple:
+        """根据api_using解析API信息"""
         api_type = self.response.api_using
 
         if api_type == "deepseek":
@@ -133,20 +171,14 @@ class Config:
 
     def get_random_model(self) -> str:
         """根据概率随机选择模型"""
-        import random
-
-        models = list(self.response.model_probabilities.keys())
-        probabilities = list(self.response.model_probabilities.values())
-        return random.choices(models, weights=probabilities, k=1)[0]
-
-
-# 全局配置实例
-config = Config()
+        return random.choices(self._models, cum_weights=self._cum_weights, k=1)[0]
 
 
 async def initialize_config():
     """初始化配置资源"""
-    ResourceManager.set("config", config)
+    # 在线程池中读取配置文件，避免阻塞事件循环
+    config_data = await asyncio.to_thread(ConfigLoader.load_config)
+    ResourceManager.set("config", Config(config_data))
 
 
 # 注册配置资源
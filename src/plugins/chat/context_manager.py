@@ -1,28 +1,49 @@
-from typing import Dict, List, Any
+from typing import Deque, Dict, Sequence, Tuple
 import time
 import asyncio
-from collections import defaultdict
+from collections import deque
 from nonebot.log import logger
 from .lifecycle import ResourceManager
+from .ai_client import get_ai_client
+
+# 上下文压缩时使用的提示词
+SUMMARY_INSTRUCTION = "用不超过120字概括以下群聊对话，保留人物、事实和未完成的话题。"
+SUMMARY_PREFIX = "[之前的对话摘要] "
+# 参与压缩的单条消息最大长度，超出部分会被截断
+MASK_CHARS = 512
+# 压缩失败后，同一会话需等待的秒数才会再次尝试，避免在上游故障时反复请求
+COMPACT_RETRY_DELAY = 120
 
 
 class ContextManager:
     """对话上下文管理器"""
 
     def __init__(self, max_context_size=10, expiration_time=1800):
-        self._group_contexts = defaultdict(lambda: defaultdict(list))
-        self._timestamps = defaultdict(lambda: defaultdict(float))
+        # 以 (group_id, user_id) 为键，只需一次哈希查找
+        self._ctx: Dict[Tuple[int, int], Deque[Dict[str, str]]] = {}
+        self._ts: Dict[Tuple[int, int], float] = {}
         self.max_context_size = max_context_size
         self.expiration_time = expiration_time  # 秒
-
-    async def get_context(self, group_id: int, user_id: int) -> List[Dict[str, str]]:
+        # 上下文条数达到容量的70%时触发压缩
+        self.compact_threshold = int(1.4 * max_context_size)
+        self._compacting = set()
+        self._tasks = set()
+        # 压缩失败的会话 -> 允许再次尝试的时间
+        self._compact_retry_at: Dict[Tuple[int, int], float] = {}
+
+    async def get_context(self, group_id: int, user_id: int) -> Sequence[Dict[str, str]]:
         """获取特定用户的对话上下文"""
-        if self._is_context_expired(group_id, user_id):
-            self._clear_context(group_id, user_id)
+        key = (group_id, user_id)
+        now = time.monotonic()
+        last_time = self._ts.get(key)
+        if last_time is None or now - last_time > self.expiration_time:
+            self._ctx.pop(key, None)
+            self._ts.pop(key, None)
+            self._compact_retry_at.pop(key, None)
             return []
 
-        self._update_timestamp(group_id, user_id)
-        return self._group_contexts[group_id][user_id]
+        self._ts[key] = now
+        return self._ctx.get(key, [])
 
     async def add_to_context(
         self,
@@ -32,47 +53,82 @@ class ContextManager:
         response: Dict[str, str],
     ):
         """添加新对话到上下文"""
-        context_list = self._group_contexts[group_id][user_id]
+        key = (group_id, user_id)
+        context_list = self._ctx.get(key)
+        if context_list is None:
+            # maxlen 会自动丢弃最旧的消息，保持上下文长度限制
+            context_list = self._ctx[key] = deque(maxlen=2 * self.max_context_size)
 
         # 添加消息对
         context_list.append(message)
         context_list.append(response)
 
-        # 保持上下文长度限制
-        while len(context_list) > self.max_context_size * 2:
-            context_list.pop(0)
-            if context_list:
-                context_list.pop(0)
-
-        self._update_timestamp(group_id, user_id)
-
-    def _update_timestamp(self, group_id: int, user_id: int):
-        """更新特定用户的时间戳"""
-        self._timestamps[group_id][user_id] = time.time()
-
-    def _is_context_expired(self, group_id: int, user_id: int) -> bool:
-        """检查特定用户的上下文是否过期"""
-        last_time = self._timestamps[group_id][user_id]
-        return (time.time() - last_time) > self.expiration_time
+        now = time.monotonic()
+        self._ts[key] = now
 
-    def _clear_context(self, group_id: int, user_id: int):
-        """清除特定用户的上下文"""
         if (
-            group_id in self._group_contexts
-            and user_id in self._group_contexts[group_id]
+            len(context_list) >= self.compact_threshold
+            and key not in self._compacting
+            and now >= self._compact_retry_at.get(key, 0)
         ):
-            self._group_contexts[group_id][user_id] = []
+            # 创建任务前先占位，避免同一会话重复触发压缩
+            self._compacting.add(key)
+            task = asyncio.create_task(self._maybe_compact(key))
+            # 保留任务引用，防止后台任务被垃圾回收
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _maybe_compact(self, key: Tuple[int, int]):
+        """将较早的一半对话概括为一条摘要，减少每次请求发送的token"""
+        try:
+            context_list = self._ctx.get(key)
+            if context_list is None or len(context_list) < self.compact_threshold:
+                return
+
+            # 保留的部分须为完整的用户/助手消息对（开头若有旧摘要，总数为奇数）
+            count = len(context_list) // 2
+            count -= (len(context_list) - count) % 2
+            old = [context_list[i] for i in range(count)]
+
+            client = await get_ai_client()
+            if not client:
+                return
+            summary = await client.summarize(
+                [
+                    {**msg, "content": msg["content"][:MASK_CHARS]}
+                    if len(msg["content"]) > MASK_CHARS
+                    else msg
+                    for msg in old
+                ],
+                SUMMARY_INSTRUCTION,
+            )
+
+            # 等待期间上下文可能已过期或被挤出，此时放弃本次压缩
+            if self._ctx.get(key) is not context_list or context_list[0] is not old[0]:
+                return
+
+            compacted = deque(maxlen=context_list.maxlen)
+            compacted.append({"role": "system", "content": SUMMARY_PREFIX + summary})
+            compacted.extend(context_list[i] for i in range(count, len(context_list)))
+            self._ctx[key] = compacted
+            self._compact_retry_at.pop(key, None)
+            logger.debug(f"已压缩上下文 {key}: {len(context_list)} -> {len(compacted)} 条")
+        except Exception as e:
+            self._compact_retry_at[key] = time.monotonic() + COMPACT_RETRY_DELAY
+            logger.warning(f"压缩上下文 {key} 失败，{COMPACT_RETRY_DELAY}秒内不再尝试: {e}")
+        finally:
+            self._compacting.discard(key)
 
     async def clear_expired_contexts(self):
         """清理过期上下文"""
-        count = 0
-        for group_id in list(self._timestamps.keys()):
-            for user_id in list(self._timestamps[group_id].keys()):
-                if self._is_context_expired(group_id, user_id):
-                    self._clear_context(group_id, user_id)
-                    count += 1
-        if count > 0:
-            logger.debug(f"已清理 {count} 个过期上下文")
+        now = time.monotonic()
+        expired = [k for k, t in self._ts.items() if now - t > self.expiration_time]
+        for key in expired:
+            self._ctx.pop(key, None)
+            self._compact_retry_at.pop(key, None)
+            del self._ts[key]
+        if expired:
+            logger.debug(f"已清理 {len(expired)} 个过期上下文")
 
 
 async def initialize_context_manager():
@@ -1,23 +1,62 @@
 from typing import Dict, Any, Optional
-import json
+import asyncio
 import os
 from pathlib import Path
+import ahocorasick
+import aiofiles
+import orjson
 from nonebot.log import logger
 from .lifecycle import ResourceManager
 
 class GroupConfig:
     """群组特定配置"""
     
+    __slots__ = (
+        "group_id", "enabled", "random_reply_rate",
+        "trigger_keywords", "blacklist_users", "_kw_ac"
+    )
+    
     def __init__(self, group_id: int, data: Dict[str, Any] = None):
         self.group_id = group_id
         self.enabled = True
         self.random_reply_rate = 0.1  # 默认随机回复率
         self.trigger_keywords = []    # 群特定触发词
-        self.blacklist_users = []     # 群内黑名单用户
+        self.blacklist_users = frozenset()  # 群内黑名单用户
         
-        # 加载提供的数据
+        # 加载提供的数据（忽略未知字段）
         if data:
-            self.__dict__.update(data)
+            for key, value in data.items():
+                if key in self.__slots__ and not key.startswith("_"):
+                    setattr(self, key, value)
+        
+        # 黑名单只用于成员判断，使用frozenset实现O(1)查找
+        self.blacklist_users = frozenset(int(x) for x in self.blacklist_users)
+        # 触发词自动机在首次匹配时才构建；False 表示没有可用的触发词
+        self._kw_ac = None
+    
+    def build_keyword_automaton(self):
+        """将触发词预编译为Aho-Corasick自动机，一次扫描即可匹配所有关键词"""
+        automaton = ahocorasick.Automaton()
+        for i, keyword in enumerate(self.trigger_keywords):
+            # 无效的触发词只跳过该项，不影响整个群配置
+            if not isinstance(keyword, str) or not keyword:
+                logger.warning(f"群 {self.group_id} 的触发词 {keyword!r} 无效，已忽略")
+                continue
+            automaton.add_word(keyword, i)
+        
+        if len(automaton):
+            automaton.make_automaton()
+            self._kw_ac = automaton
+        else:
+            self._kw_ac = False
+    
+    def matches_trigger(self, text: str) -> bool:
+        """检查文本是否包含任一触发词"""
+        if self._kw_ac is None:
+            self.build_keyword_automaton()
+        if not self._kw_ac:
+            return False
+        return next(self._kw_ac.iter(text), None) is not None
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
@@ -26,7 +65,7 @@ class GroupConfig:
             "enabled": self.enabled,
             "random_reply_rate": self.random_reply_rate,
             "trigger_keywords": self.trigger_keywords,
-            "blacklist_users": self.blacklist_users
+            "blacklist_users": list(self.blacklist_users)
         }
 
 class GroupManager:
@@ -42,8 +81,8 @@ class GroupManager:
         self.config_dir.mkdir(exist_ok=True)
         self.groups: Dict[int, GroupConfig] = {}
         self.default_config = None
-        self.global_blacklist = []
-        self.whitelist_groups = []  # 如果不为空，则只响应这些群
+        self.global_blacklist = frozenset()
+        self.whitelist_groups = frozenset()  # 如果不为空，则只响应这些群
         
     async def load_configs(self):
         """加载所有群组配置"""
@@ -51,8 +90,8 @@ class GroupManager:
         default_path = self.config_dir / "default.json"
         if default_path.exists():
             try:
-                with open(default_path, "r", encoding="utf-8") as f:
-                    self.default_config = json.load(f)
+                async with aiofiles.open(default_path, "rb") as f:
+                    self.default_config = orjson.loads(await f.read())
                 logger.info("已加载默认群组配置")
             except Exception as e:
                 logger.error(f"加载默认群组配置失败: {e}")
@@ -61,24 +100,36 @@ class GroupManager:
         global_path = self.config_dir / "global.json"
         if global_path.exists():
             try:
-                with open(global_path, "r", encoding="utf-8") as f:
-                    global_config = json.load(f)
-                    self.global_blacklist = global_config.get("blacklist", [])
-                    self.whitelist_groups = global_config.get("whitelist_groups", [])
+                async with aiofiles.open(global_path, "rb") as f:
+                    global_config = orjson.loads(await f.read())
+                    self.global_blacklist = frozenset(
+                        int(x) for x in global_config.get("blacklist", [])
+                    )
+                    self.whitelist_groups = frozenset(
+                        int(x) for x in global_config.get("whitelist_groups", [])
+                    )
                 logger.info("已加载全局群组设置")
             except Exception as e:
                 logger.error(f"加载全局群组设置失败: {e}")
         
-        # 加载具体群组配置
-        for file in self.config_dir.glob("group_*.json"):
-            try:
-                group_id = int(file.stem.split("_")[1])
-                with open(file, "r", encoding="utf-8") as f:
-                    group_data = json.load(f)
-                    self.groups[group_id] = GroupConfig(group_id, group_data)
-                logger.debug(f"已加载群 {group_id} 的配置")
-            except Exception as e:
-                logger.error(f"加载群组配置失败 {file.name}: {e}")
+        # 并发加载具体群组配置
+        paths = list(self.config_dir.glob("group_*.json"))
+        results = await asyncio.gather(
+            *(self._load_group_file(path) for path in paths), return_exceptions=True
+        )
+        for path, result in zip(paths, results):
+            if isinstance(result, Exception):
+                logger.error(f"加载群组配置失败 {path.name}: {result}")
+        self.groups.update(
+            {result.group_id: result for result in results if isinstance(result, GroupConfig)}
+        )
+        logger.debug(f"已加载 {len(self.groups)} 个群的配置")
+    
+    async def _load_group_file(self, path: Path) -> GroupConfig:
+        """读取单个群组配置文件"""
+        group_id = int(path.stem.split("_")[1])
+        async with aiofiles.open(path, "rb") as f:
+            return GroupConfig(group_id, orjson.loads(await f.read()))
     
     async def get_group_config(self, group_id: int) -> Optional[GroupConfig]:
         """获取指定群的配置"""
@@ -100,9 +151,12 @@ class GroupManager:
         """保存群组配置"""
         if group_id in self.groups:
             file_path = self.config_dir / f"group_{group_id}.json"
+            # 触发词可能已被修改，下次匹配时重新构建自动机
+            self.groups[group_id]._kw_ac = None
             try:
-                with open(file_path, "w", encoding="utf-8") as f:
-                    json.dump(self.groups[group_id].to_dict(), f, ensure_ascii=False, indent=4)
+                data = orjson.dumps(self.groups[group_id].to_dict(), option=orjson.OPT_INDENT_2)
+                async with aiofiles.open(file_path, "wb") as f:
+                    await f.write(data)
                 logger.debug(f"已保存群 {group_id} 的配置")
             except Exception as e:
                 logger.error(f"保存群 {group_id} 配置失败: {e}")
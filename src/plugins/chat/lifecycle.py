@@ -1,5 +1,6 @@
-from typing import Dict, Any, Optional, Callable, List, TypeVar
+from typing import Dict, Any, Optional, Callable, List, Set, TypeVar
 import asyncio
+from collections import deque
 from nonebot import get_driver
 from nonebot.log import logger
 
@@ -12,58 +13,76 @@ class ResourceManager:
     _resources: Dict[str, Any] = {}
     _ready_events: Dict[str, asyncio.Event] = {}
     _dependencies: Dict[str, List[str]] = {}
-    _initialized = False
-    _initializing = False
+    _initializers: Dict[str, Callable] = {}
+    # 依赖图在注册时增量维护：依赖 -> 依赖它的资源，以及每个资源的入度
+    _graph: Dict[str, List[str]] = {}
+    _in_degree: Dict[str, int] = {}
+    _order_cache: Optional[List[str]] = None
+    _init_failures: Set[str] = set()
+    # 初始化只会启动一次；检查与置位之间没有await，在事件循环中天然原子
+    _started = False
 
     @classmethod
     async def initialize(cls):
         """初始化所有资源"""
-        if cls._initialized or cls._initializing:
+        if cls._started:
             return
 
-        cls._initializing = True
+        cls._started = True
         logger.info("开始初始化资源...")
 
         # 按依赖顺序初始化
         for name in cls._get_initialization_order():
-            init_func = cls._resources.get(f"{name}_initializer")
+            init_func = cls._initializers.get(name)
             if init_func and callable(init_func):
                 try:
                     logger.debug(f"初始化资源: {name}")
                     result = init_func()
                     if asyncio.iscoroutine(result):
                         await result
-
-                    # 设置资源就绪事件
-                    if name in cls._ready_events:
-                        cls._ready_events[name].set()
                 except Exception as e:
+                    cls._init_failures.add(name)
                     logger.error(f"初始化资源 {name} 失败: {str(e)}")
 
-        cls._initialized = True
-        cls._initializing = False
+                # 无论成功与否都设置就绪事件：失败时等待者立即得到None，
+                # 不必空等到超时（Event.set只在事件循环内调用，无需加锁）
+                event = cls._ready_events.get(name)
+                if event is not None:
+                    event.set()
+
+        if cls._init_failures:
+            logger.warning(f"以下资源未能初始化: {', '.join(cls._init_failures)}")
+
         logger.info("资源初始化完成")
 
     @classmethod
     def _get_initialization_order(cls) -> List[str]:
-        """获取基于依赖关系的初始化顺序"""
-        # 简单的拓扑排序实现
+        """获取基于依赖关系的初始化顺序（Kahn拓扑排序，结果会被缓存）"""
+        if cls._order_cache is not None:
+            return cls._order_cache
+
+        # 直接在预先构建的图上运行Kahn算法，只复制入度计数
+        in_degree = dict(cls._in_degree)
+        queue = deque(name for name, degree in in_degree.items() if degree == 0)
         visited = set()
         order = []
-
-        def visit(name):
-            if name in visited:
-                return
+        while queue:
+            name = queue.popleft()
             visited.add(name)
-            for dep in cls._dependencies.get(name, []):
-                visit(dep)
-            order.append(name)
-
-        for name in cls._resources:
-            if name.endswith("_initializer"):
-                resource_name = name[:-12]  # 去掉"_initializer"后缀
-                visit(resource_name)
-
+            if name in cls._initializers:
+                order.append(name)
+            for dependent in cls._graph.get(name, ()):
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    queue.append(dependent)
+
+        # 存在循环依赖时，剩余资源按注册顺序初始化
+        if len(visited) < len(in_degree):
+            remaining = [name for name in cls._initializers if name not in visited]
+            logger.warning(f"检测到循环依赖: {', '.join(remaining)}")
+            order.extend(remaining)
+
+        cls._order_cache = order
         return order
 
     @classmethod
@@ -74,15 +93,30 @@ class ResourceManager:
         dependencies: List[str] = None,
         initializer: Callable = None,
     ):
-        """注册资源和它的依赖关系"""
+        """
+        注册资源和它的依赖关系
+        在模块导入时同步调用，直接写入资源表和依赖图，无需启动时再统一注册
+        """
         if resource is not None:
             cls._resources[name] = resource
 
         if initializer is not None:
-            cls._resources[f"{name}_initializer"] = initializer
+            cls._initializers[name] = initializer
+            cls._order_cache = None
 
+        cls._in_degree.setdefault(name, 0)
         if dependencies:
+            # 重复注册时先移除旧的依赖边
+            for dep in cls._dependencies.get(name, []):
+                cls._graph[dep].remove(name)
+                cls._in_degree[name] -= 1
+
             cls._dependencies[name] = dependencies
+            for dep in dependencies:
+                cls._graph.setdefault(dep, []).append(name)
+                cls._in_degree.setdefault(dep, 0)
+                cls._in_degree[name] += 1
+            cls._order_cache = None
 
         # 创建资源就绪事件
         if name not in cls._ready_events:
@@ -92,26 +126,30 @@ class ResourceManager:
     async def get(cls, name: str, timeout: float = 10.0) -> Optional[T]:
         """获取资源，如果资源不可用会等待指定时间"""
         # 如果资源已存在，直接返回
-        if name in cls._resources:
-            return cls._resources[name]
+        resource = cls._resources.get(name)
+        if resource is not None:
+            return resource
 
-        # 如果资源有就绪事件，等待它
-        if name in cls._ready_events:
+        # 如果资源有就绪事件，等待它（已就绪时不再创建超时等待）
+        event = cls._ready_events.get(name)
+        if event is None:
+            return None
+        if not event.is_set():
             try:
-                await asyncio.wait_for(cls._ready_events[name].wait(), timeout)
-                return cls._resources.get(name)
+                await asyncio.wait_for(event.wait(), timeout)
             except asyncio.TimeoutError:
                 logger.warning(f"等待资源 {name} 超时")
                 return None
 
-        return None
+        return cls._resources.get(name)
 
     @classmethod
     def set(cls, name: str, resource: Any):
         """设置资源值并标记为就绪"""
         cls._resources[name] = resource
-        if name in cls._ready_events:
-            cls._ready_events[name].set()
+        event = cls._ready_events.get(name)
+        if event is not None:
+            event.set()
 
 
 # 在NoneBot启动时初始化资源
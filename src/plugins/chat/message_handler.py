@@ -1,9 +1,47 @@
 import re
 import time
 import random
+import itertools
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import List, Tuple, Optional
 from nonebot.adapters.onebot.v11 import GroupMessageEvent, Message
 
+# 各种情况下的回复概率
+_P_AT = 0.95  # 被@时（偶尔装作"没看到"）
+_P_RELEVANT = 0.85  # 与上次发言相关时
+_P_SAME_USER = 0.2  # 5分钟内回复过同一用户时
+_P_DEFAULT = 0.1  # 其他情况
+_P_NO_TEXT = 0.02  # 没有文字（纯图片/表情）且未被@时
+
+# 假设平均打字速度为每分钟200字，预先算好每个字所需秒数
+_SEC_PER_CHAR = 60 / 200
+
+# 语气词，以及替换句号时可选的标点
+_FILLERS = ("嗯", "啊", "呢", "吧", "啦", "哈", "哦")
+_PUNCT_ALTS = ("...", "！")
+
+# 缓存随机函数，省去每次的属性查找
+_rand = random.random
+_randbits = random.getrandbits
+# 只关心时间差，使用单调时钟，不受系统时间调整影响
+_now = time.monotonic
+
+# 状态记录的最大条目数，超出后淘汰最久未更新的条目
+_MAX_STATE_ENTRIES = 4096
+
+
+@dataclass
+class IncomingCtx:
+    """单条消息的预处理结果，避免在各处理环节重复计算"""
+
+    # 字段均无默认值，可直接声明 __slots__（兼容 Python 3.9）
+    __slots__ = ("text", "is_at", "length_ok")
+
+    text: str
+    is_at: bool
+    length_ok: bool
+
 
 class MessageProcessor:
     """
@@ -11,30 +49,49 @@ class MessageProcessor:
     不包含明显的机器人特征，避免暴露身份
     """
 
-    # 上次回复时间记录 (模拟自然间隔)
-    _last_reply_time = {}
+    # 上次回复时间记录 (模拟自然间隔)，键为 (group_id, user_id)
+    _last_reply_time = OrderedDict()
+
+    # 对话状态 (模拟人类对话连贯性)，键为 group_id，值为话题词的预编译正则
+    _conversation_state = OrderedDict()
 
-    # 对话状态 (模拟人类对话连贯性)
-    _conversation_state = {}
+    @staticmethod
+    def _lru_set(store: OrderedDict, key, value):
+        """写入记录并淘汰最旧的条目，防止状态无限增长"""
+        store[key] = value
+        store.move_to_end(key)
+        if len(store) > _MAX_STATE_ENTRIES:
+            store.popitem(last=False)
 
     @classmethod
-    def extract_text(cls, event: GroupMessageEvent) -> str:
-        """提取消息文本"""
-        text = ""
-        for seg in event.message:
-            if seg.type == "text":
-                text += seg.data["text"]
+    def parse_message(
+        cls, event: GroupMessageEvent, bot_qq: int
+    ) -> Tuple[List[str], str, bool]:
+        """单次遍历消息段，同时提取图片、文本和@机器人状态"""
+        image_urls = []
+        text_parts = []
+        is_at = False
 
-        # 简单清理文本
-        return text.strip()
+        for seg in event.message:
+            seg_type = seg.type
+            if seg_type == "text":
+                text_parts.append(seg.data["text"])
+            elif seg_type == "image":
+                if "url" in seg.data:
+                    image_urls.append(seg.data["url"])
+            elif seg_type == "at" and not is_at:
+                # 只在少见的@消息段上做类型转换（"all" 等非数字会被忽略）
+                try:
+                    is_at = int(seg.data["qq"]) == bot_qq
+                except (KeyError, ValueError):
+                    pass
+
+        return image_urls, "".join(text_parts).strip(), is_at
 
     @classmethod
-    def is_at_bot(cls, event: GroupMessageEvent, bot_qq: str) -> bool:
+    def is_at_bot(cls, event: GroupMessageEvent, bot_qq: int) -> bool:
         """检查消息是否@机器人"""
-        return any(
-            seg.type == "at" and str(seg.data.get("qq", "")) == str(bot_qq)
-            for seg in event.message
-        )
+        return cls.parse_message(event, bot_qq)[2]
 
     @classmethod
     def should_reply(cls, text: str, is_at: bool, group_id: int, user_id: int) -> bool:
@@ -42,62 +99,58 @@ class MessageProcessor:
         决定是否回复（模拟人类行为）
         根据内容相关性、@状态、最近回复时间等判断
         """
-        current_time = time.time()
-        key = f"{group_id}_{user_id}"
+        # 每条消息只抽一次随机数，按所在分支的阈值判断
+        r = _rand()
 
         # 如果被@，有较高概率回复
         if is_at:
             # 但也不是100%回复，偶尔装作"没看到"
-            return random.random() < 0.95
+            return r < _P_AT
+
+        # 纯图片/表情消息没有可匹配的内容，直接按低概率判断
+        if not text:
+            return r < _P_NO_TEXT
 
         # 检查是否是对自己上次发言的回复
         is_relevant = cls._is_relevant_to_me(text, group_id)
         if is_relevant:
-            return random.random() < 0.85
+            return r < _P_RELEVANT
 
         # 避免频繁回复同一用户（模拟人类注意力分散）
-        last_time = cls._last_reply_time.get(key, 0)
-        if current_time - last_time < 300:  # 5分钟内
-            return random.random() < 0.2
+        last_time = cls._last_reply_time.get((group_id, user_id))
+        if last_time is not None and _now() - last_time < 300:  # 5分钟内
+            return r < _P_SAME_USER
 
         # 在保持群内存在感的同时，不对每条消息都回复
-        return random.random() < 0.1
+        return r < _P_DEFAULT
 
     @classmethod
     def _is_relevant_to_me(cls, text: str, group_id: int) -> bool:
         """判断消息是否与机器人上次发言相关（简单实现）"""
-        last_topic = cls._conversation_state.get(f"topic_{group_id}", "")
-        if not last_topic:
-            return False
-
-        # 简单关键词匹配，实际应用中可能需要更复杂的相关性分析
-        return any(keyword in text for keyword in last_topic.split())
+        # 简单关键词匹配，使用预编译的正则一次扫描所有话题词
+        pattern = cls._conversation_state.get(group_id)
+        return bool(pattern and pattern.search(text))
 
     @classmethod
     def update_conversation_state(cls, group_id: int, user_id: int, text: str):
         """更新对话状态，记录回复时间"""
-        cls._last_reply_time[f"{group_id}_{user_id}"] = time.time()
+        cls._lru_set(cls._last_reply_time, (group_id, user_id), _now())
 
-        # 提取可能的主题词作为上下文（简单实现）
-        words = [w for w in text.split() if len(w) > 1]
-        if words:
-            # 随机选择几个词作为话题记忆
-            topic_words = random.sample(words, min(3, len(words)))
-            cls._conversation_state[f"topic_{group_id}"] = " ".join(topic_words)
+        # 提取可能的主题词作为上下文（简单实现）：取前几个词作为话题记忆
+        topic_words = list(
+            itertools.islice((w for w in text.split() if len(w) > 1), 3)
+        )
+        if topic_words:
+            cls._lru_set(
+                cls._conversation_state,
+                group_id,
+                re.compile("|".join(map(re.escape, topic_words))),
+            )
 
     @classmethod
     def extract_images_and_text(cls, event: GroupMessageEvent) -> Tuple[List[str], str]:
         """提取消息中的图片和文本"""
-        image_urls = []
-        text_parts = []
-
-        for seg in event.message:
-            if seg.type == "text":
-                text_parts.append(seg.data["text"])
-            elif seg.type == "image" and "url" in seg.data:
-                image_urls.append(seg.data["url"])
-
-        return image_urls, "".join(text_parts).strip()
+        return cls.parse_message(event, 0)[:2]
 
     @classmethod
     def add_human_touch(cls, text: str) -> str:
@@ -107,23 +160,45 @@ class MessageProcessor:
         - 添加语气词
         - 随机使用不同标点符号
         """
-        # 随机决定是否添加人类特征
-        if random.random() < 0.3:
-            # 偶尔添加半括号
-            if random.random() < 0.4:
-                text += "（"
-
-            # 偶尔添加语气词
-            if random.random() < 0.3:
-                fillers = ["嗯", "啊", "呢", "吧", "啦", "哈", "哦"]
-                position = random.randint(0, len(text))
-                text = text[:position] + random.choice(fillers) + text[position:]
+        # 一次取32位随机数，按位段做各项概率判断：
+        # 0-9位 总开关(30%)，10-19位 半括号(40%)，20-29位 语气词(30%)，
+        # 30位 是否替换标点(50%)，31位 替换成哪种标点
+        bits = _randbits(32)
 
-            # 偶尔替换标点
-            if "。" in text and random.random() < 0.5:
-                text = text.replace("。", "..." if random.random() < 0.5 else "！", 1)
-
-        return text
+        # 随机决定是否添加人类特征
+        if (bits & 0x3FF) >= 307:
+            return text
+
+        # 偶尔添加半括号
+        if ((bits >> 10) & 0x3FF) < 410:
+            text += "（"
+
+        # 先收集修改 (位置, 替换长度, 内容)，最后一次拼接，避免多次复制整个字符串
+        edits = []
+
+        # 偶尔添加语气词
+        if ((bits >> 20) & 0x3FF) < 307:
+            filler = _FILLERS[_randbits(16) % len(_FILLERS)]
+            edits.append((random.randint(0, len(text)), 0, filler))
+
+        # 偶尔替换第一个句号
+        if (bits >> 30) & 1:
+            index = text.find("。")
+            if index >= 0:
+                edits.append((index, 1, _PUNCT_ALTS[bits >> 31]))
+
+        if not edits:
+            return text
+
+        # 同一位置时插入排在替换之前，与逐步修改的结果一致
+        parts = []
+        start = 0
+        for position, width, token in sorted(edits):
+            parts.append(text[start:position])
+            parts.append(token)
+            start = position + width
+        parts.append(text[start:])
+        return "".join(parts)
 
     @classmethod
     def calculate_typing_delay(cls, text: str) -> float:
@@ -131,19 +206,21 @@ class MessageProcessor:
         计算模拟打字延迟（秒）
         模拟人类打字速度
         """
-        # 假设平均打字速度为每分钟200字
-        char_per_second = 200 / 60
+        length = len(text)
 
         # 基础延迟
-        base_delay = max(1.0, len(text) / char_per_second)
+        base_delay = max(1.0, length * _SEC_PER_CHAR)
+
+        # 一次取32位随机数，拆成两个独立的 [0, 1) 均匀值
+        bits = _randbits(32)
 
-        # 添加随机波动（模拟思考和打字不均匀）
-        randomness = random.uniform(0.8, 1.2)
+        # 添加随机波动（模拟思考和打字不均匀），范围 0.8 ~ 1.2
+        randomness = 0.8 + 0.4 * ((bits & 0xFFFF) / 65536)
 
-        # 长消息额外思考时间
+        # 长消息额外思考时间，范围 1 ~ 3 秒
         thinking_time = 0
-        if len(text) > 20:
-            thinking_time = random.uniform(1, 3)
+        if length > 20:
+            thinking_time = 1 + 2 * ((bits >> 16) / 65536)
 
         return base_delay * randomness + thinking_time
 
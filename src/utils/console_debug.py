@@ -1,3 +1,5 @@
+import asyncio
+import threading
 from nonebot.log import logger
 from nonebot import get_driver
 
@@ -8,8 +10,16 @@ class ConsoleDebugger:
 
     async def debug_flow(self):
         logger.success("进入控制台调试模式")
+        # 由守护线程读取输入，不占用默认线程池，退出时也不会阻塞进程
+        queue = asyncio.Queue()
+        threading.Thread(
+            target=_read_stdin, args=(asyncio.get_running_loop(), queue), daemon=True
+        ).start()
         while True:
-            cmd = input("[DEBUG] > ")
+            cmd = await queue.get()
+            # 输入流已关闭
+            if cmd is None:
+                break
 
             # 执行插件热重载
             if cmd == "reload":
@@ -30,6 +40,30 @@ class ConsoleDebugger:
         logger.warning("已强制重载所有插件")
 
 
-# 在bot启动时挂载
+def _read_stdin(loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+    """逐行读取标准输入并投递到事件循环，读到EOF时投递None"""
+    while True:
+        try:
+            line = input("[DEBUG] > ")
+        except EOFError:
+            line = None
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, line)
+        except RuntimeError:
+            # 事件循环已关闭
+            return
+        if line is None:
+            return
+
+
+# 仅在配置 CONSOLE_DEBUG=true 时于bot启动后挂载
 driver = get_driver()
-driver.on_startup(ConsoleDebugger().debug_flow)
+_debug_task = None
+
+if getattr(driver.config, "console_debug", False):
+
+    @driver.on_startup
+    async def start_console_debugger():
+        # 作为后台任务运行，不阻塞启动流程
+        global _debug_task
+        _debug_task = asyncio.create_task(ConsoleDebugger().debug_flow())
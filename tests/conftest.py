@@ -0,0 +1,4 @@
+import nonebot
+
+# 插件模块在导入时会注册到驱动上，需先初始化NoneBot
+nonebot.init()
@@ -0,0 +1,97 @@
+import asyncio
+
+from src.plugins.chat import context_manager as cm
+
+
+class FailingClient:
+    """摘要请求总是失败的假AI客户端"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def summarize(self, messages, instruction, max_tokens=200):
+        self.calls += 1
+        raise RuntimeError("upstream down")
+
+
+class FakeClient:
+    """只记录摘要请求的假AI客户端"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def summarize(self, messages, instruction, max_tokens=200):
+        self.calls.append(list(messages))
+        return "摘要"
+
+
+def test_compaction_keeps_message_pairs(monkeypatch):
+    client = FakeClient()
+
+    async def fake_get_ai_client():
+        return client
+
+    monkeypatch.setattr(cm, "get_ai_client", fake_get_ai_client)
+
+    async def add_pairs(manager, start, stop):
+        for i in range(start, stop):
+            await manager.add_to_context(
+                group_id=1,
+                user_id=2,
+                message={"role": "user", "content": f"q{i}"},
+                response={"role": "assistant", "content": f"a{i}"},
+            )
+
+    async def run():
+        manager = cm.ContextManager(max_context_size=15)  # 21条时触发压缩
+        key = (1, 2)
+
+        # 22条消息：压缩前10条，其余6对保留
+        await add_pairs(manager, 0, 11)
+        assert key in manager._compacting
+        await asyncio.gather(*manager._tasks)
+        assert key not in manager._compacting
+        assert not manager._tasks
+
+        context = list(await manager.get_context(1, 2))
+        assert len(client.calls[0]) == 10
+        assert context[0] == {"role": "system", "content": cm.SUMMARY_PREFIX + "摘要"}
+        assert context[1]["content"] == "q5"
+        assert len(context) == 13
+
+        # 开头有旧摘要时总数为奇数，仍只压缩到完整的消息对为止
+        await add_pairs(manager, 11, 15)
+        await asyncio.gather(*manager._tasks)
+
+        context = list(await manager.get_context(1, 2))
+        assert len(client.calls[1]) == 9
+        assert context[1]["content"] == "q9"
+        assert [m["role"] for m in context[1:]] == ["user", "assistant"] * 6
+
+    asyncio.run(run())
+
+
+def test_failed_compaction_backs_off(monkeypatch):
+    client = FailingClient()
+
+    async def fake_get_ai_client():
+        return client
+
+    monkeypatch.setattr(cm, "get_ai_client", fake_get_ai_client)
+
+    async def run():
+        manager = cm.ContextManager(max_context_size=10)
+        for i in range(20):
+            await manager.add_to_context(
+                group_id=1,
+                user_id=2,
+                message={"role": "user", "content": f"q{i}"},
+                response={"role": "assistant", "content": f"a{i}"},
+            )
+            await asyncio.gather(*manager._tasks)
+
+        # 失败一次后进入冷却期，不会每轮都重新请求
+        assert client.calls == 1
+        assert (1, 2) in manager._compact_retry_at
+
+    asyncio.run(run())